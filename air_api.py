@@ -0,0 +1,229 @@
+import os
+import json
+import queue
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import air_store
+
+# Servicio HTTP de consultas sobre el almacén que mantiene data_fetcher.py.
+# Todas las herramientas comparten una única copia indexada y caliente en lugar de parsear JSONL.
+#
+#   GET /latest?node=air-sensor
+#   GET /range?start=...&end=...&table=samples&limit=5000
+#   GET /resample?start=...&end=...&bucket=60&table=samples
+#   GET /states?start=...&end=...
+#
+# start/end aceptan ISO-8601 o epoch en milisegundos. Las respuestas se cachean en un LRU que
+# se vacía en cuanto el fetcher confirma una ingesta (PRAGMA data_version) y llevan ETag.
+API_PORT = 8766
+# Sin autenticación: por defecto sólo local. AIR_API_HOST=0.0.0.0 la abre a la red a propósito.
+API_HOST = os.environ.get("AIR_API_HOST", "127.0.0.1")
+CACHE_ENTRIES = 256
+RANGE_LIMIT_MAX = 50000
+SAMPLE_PERIOD_SEC = 2  # SAMPLE_EVERY de air_logger.py
+
+class QueryError(ValueError):
+    pass
+
+def _parse_time(value, default):
+    if value is None:
+        return default
+    if value.lstrip("-").isdigit():
+        return int(value)
+    try:
+        return air_store.iso_to_ms(value)
+    except ValueError:
+        raise QueryError(f"Instante inválido: {value}")
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat() if ms is not None else None
+
+def _rows(cursor):
+    out = []
+    for row in cursor:
+        d = dict(row)
+        for key in ("ts", "ts_end", "bucket"):
+            if key in d:
+                d[key] = _iso(d[key])
+        out.append(d)
+    return out
+
+def _table(params, allowed=("samples", "batches", "minutes")):
+    table = params.get("table", "samples")
+    if table not in allowed:
+        raise QueryError(f"Tabla no soportada: {table}")
+    return table
+
+def _window(params):
+    return _parse_time(params.get("start"), 0), _parse_time(params.get("end"), 2**62)
+
+def q_latest(conn, params):
+    node = params.get("node", air_store.DEFAULT_NODE)
+    row = conn.execute("SELECT * FROM samples WHERE node = ? ORDER BY ts DESC LIMIT 1", (node,)).fetchone()
+    return _rows([row])[0] if row else None
+
+def q_range(conn, params):
+    table = _table(params)
+    start, end = _window(params)
+    try:
+        limit = max(1, min(int(params.get("limit", 5000)), RANGE_LIMIT_MAX))
+    except ValueError:
+        raise QueryError("limit debe ser un entero")
+    cur = conn.execute(
+        f"SELECT * FROM {table} WHERE node = ? AND ts BETWEEN ? AND ? ORDER BY ts LIMIT ?",
+        (params.get("node", air_store.DEFAULT_NODE), start, end, limit),
+    )
+    return _rows(cur)
+
+def q_resample(conn, params):
+    table = _table(params)
+    start, end = _window(params)
+    try:
+        bucket_ms = max(1, int(params.get("bucket", 60))) * 1000
+    except ValueError:
+        raise QueryError("bucket debe ser un entero (segundos)")
+    metrics = air_store.TABLES[table]["metrics"]
+    cols = ", ".join(
+        f'AVG({col}) AS "{name}", MIN({col}) AS "{name} min", MAX({col}) AS "{name} max"'
+        for name, col in metrics.items()
+    )
+    cur = conn.execute(
+        f"SELECT (ts / ?) * ? AS bucket, COUNT(*) AS n, {cols} FROM {table} "
+        f"WHERE node = ? AND ts BETWEEN ? AND ? GROUP BY bucket ORDER BY bucket",
+        (bucket_ms, bucket_ms, params.get("node", air_store.DEFAULT_NODE), start, end),
+    )
+    return _rows(cur)
+
+def q_states(conn, params):
+    start, end = _window(params)
+    cur = conn.execute(
+        "SELECT state, COUNT(*) AS n FROM samples WHERE node = ? AND ts BETWEEN ? AND ? GROUP BY state",
+        (params.get("node", air_store.DEFAULT_NODE), start, end),
+    )
+    return {row["state"]: round(row["n"] * SAMPLE_PERIOD_SEC / 60.0, 1) for row in cur}
+
+ROUTES = {
+    "/latest": q_latest,
+    "/range": q_range,
+    "/resample": q_resample,
+    "/states": q_states,
+}
+
+class QueryService:
+    """Conexiones de sólo lectura + LRU de respuestas invalidado por data_version.
+
+    El candado sólo protege el LRU y la versión; las consultas corren en paralelo, cada una
+    con una conexión del pool (data_version se lee siempre en la misma conexión, porque su
+    valor sólo es comparable dentro de una conexión).
+    """
+
+    def __init__(self, db_path=air_store.DB_PATH, max_entries=CACHE_ENTRIES):
+        self.db_path = db_path
+        self.conn = air_store.connect(db_path, read_only=True)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # clave -> (body, etag)
+        self._version = None
+        self._lock = threading.Lock()
+        self._pool = queue.SimpleQueue()
+
+    def _query(self, route, params):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = air_store.connect(self.db_path, read_only=True)
+        try:
+            return route(conn, params)
+        finally:
+            self._pool.put(conn)
+
+    def handle(self, path, params):
+        route = ROUTES.get(path)
+        if route is None:
+            raise KeyError(path)
+        key = (path, tuple(sorted(params.items())))
+        with self._lock:
+            # data_version cambia cuando otra conexión (el fetcher) confirma una transacción
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+
+        body = json.dumps(self._query(route, params), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        entry = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        with self._lock:
+            # Si entretanto llegó una ingesta, la respuesta no se guarda bajo la versión nueva
+            if version == self._version:
+                self._cache[key] = entry
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return entry
+
+def make_handler(service):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_error_json(self, status, message):
+            body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                body, etag = service.handle(url.path, params)
+            except KeyError:
+                self._send_error_json(404, f"Ruta desconocida: {url.path}")
+                return
+            except QueryError as e:
+                self._send_error_json(400, str(e))
+                return
+            except sqlite3.Error as e:
+                # Almacén bloqueado, dañado o aún sin crear por el fetcher
+                logging.error(f"Error de consulta en {url.path}: {e}")
+                self._send_error_json(503, "Almacén no disponible")
+                return
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logging.info(fmt % args)
+
+    return QueryHandler
+
+def serve(db_path=air_store.DB_PATH, port=API_PORT, host=API_HOST):
+    service = QueryService(db_path)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    logging.info(f"API de consultas sobre {db_path} en http://{host}:{port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - [%(levelname)s] - %(message)s'
+    )
+    serve()
@@ -0,0 +1,52 @@
+# Capa de esquema única para los registros del nodo: alias heredados -> columnas canónicas
+# (aplicado al ingerir) y tipos compactos para los DataFrames que consume el dashboard.
+
+# Nombres antiguos que han usado distintas versiones de air_logger.py / air_batches
+ALIASES = {
+    "samples": {
+        "temperature": "temp", "Temp": "temp", "temperature_last": "temp",
+        "humidity": "hum", "Humidity": "hum", "humidity_last": "hum",
+        "score": "air_score", "air_score_last": "air_score",
+        "air_state": "state", "air_state_last": "state",
+        "heat_stable_ratio": "heat_stable_ratio_1m",
+    },
+    "batches": {
+        "temperature_last": "temp_avg", "temperature": "temp_avg", "Temp": "temp_avg", "temp": "temp_avg",
+        "humidity_last": "hum_avg", "humidity": "hum_avg", "Humidity": "hum_avg", "hum": "hum_avg",
+        "air_score": "air_score_last", "score": "air_score_last",
+        "state": "air_state_last",
+    },
+}
+
+CATEGORY_COLUMNS = {"node", "state", "air_state_last", "state_last", "state_before", "state_after"}
+TIME_COLUMNS = {"ts_end"}
+INT_COLUMNS = {"minutes_good", "minutes_ok", "minutes_bad", "samples", "transitions", "n", "samples_bad"}
+BOOL_COLUMNS = {"heat_stable"}
+
+def normalize_record(table, obj):
+    """Renombra alias heredados a la columna canónica (sin pisar un valor canónico presente)."""
+    aliases = ALIASES.get(table)
+    if not aliases:
+        return obj
+    for old, new in aliases.items():
+        if old in obj and new not in obj:
+            obj[new] = obj.pop(old)
+    return obj
+
+def typed_frame(df):
+    """ts (epoch-ms) como índice datetime64 UTC, estados categóricos y sensores en float32."""
+    import pandas as pd
+    if "ts" in df.columns:
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("ts"), unit="ms", utc=True), name="ts")
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype("category")
+        elif col in TIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col], unit="ms", utc=True)
+        elif col in INT_COLUMNS:
+            df[col] = df[col].astype("Int32")
+        elif col in BOOL_COLUMNS:
+            df[col] = df[col].astype("boolean")
+        elif df[col].dtype.kind in "fi" or df[col].dtype == object:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    return df
@@ -0,0 +1,412 @@
+import os
+import json
+import math
+import sqlite3
+import logging
+from datetime import datetime
+from raspberry_pi_scripts import air_binlog
+import air_schema
+
+# Almacén embebido (SQLite) alimentado por data_fetcher.py y consultado por app.py.
+# Los JSONL siguen siendo la copia fiel de la Pi; aquí sólo se ingieren las líneas nuevas.
+DB_PATH = "air_store.db"
+DEFAULT_NODE = "air-sensor"
+INGEST_BATCH_ROWS = 1000
+
+# Separación máxima entre registros consecutivos para considerarlos un mismo tramo continuo
+COVERAGE_GAP_MS = {
+    "samples": 10_000,       # 5 muestras de 2 s
+    "minutes": 180_000,      # 3 agregados de 1 minuto
+    "batches": 1_800_000,    # 2 batches de 15 minutos
+}
+
+# Definición de tablas: campo de tiempo del JSONL, columnas almacenadas y
+# qué columna corresponde a cada métrica que muestra el dashboard.
+TABLES = {
+    "samples": {
+        "ts_field": "ts",
+        "columns": [
+            "temp", "hum", "pres", "gas", "gas_med_1m", "baseline", "deviation",
+            "air_score", "state", "heat_stable", "heat_stable_ratio_1m",
+        ],
+        "metrics": {"Temperature": "temp", "Humidity": "hum", "Air Quality": "air_score"},
+    },
+    "batches": {
+        "ts_field": "ts_start",
+        "columns": [
+            "ts_end", "temp_avg", "hum_avg", "pres_avg", "gas_median", "gas_min", "gas_max",
+            "baseline_gas_end", "air_score_last", "heat_stable_ratio",
+            "minutes_good", "minutes_ok", "minutes_bad", "air_state_last",
+        ],
+        "metrics": {"Temperature": "temp_avg", "Humidity": "hum_avg", "Air Quality": "air_score_last"},
+    },
+    # Agregados de 1 minuto que deja la retención de la Pi (air_samples_1m.jsonl)
+    "minutes": {
+        "ts_field": "ts_start",
+        "columns": [
+            "ts_end", "n", "temp_avg", "hum_avg", "pres_avg", "gas_median", "deviation_min",
+            "air_score_avg", "air_score_min", "state_last", "samples_bad",
+        ],
+        "metrics": {"Temperature": "temp_avg", "Humidity": "hum_avg", "Air Quality": "air_score_avg"},
+    },
+    # Episodios BAD detectados en la Pi (air_events.jsonl)
+    "events": {
+        "ts_field": "ts_start",
+        "columns": [
+            "ts_end", "duration_s", "peak_deviation", "min_score", "samples",
+            "transitions", "state_before", "state_after",
+        ],
+    },
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    temp REAL, hum REAL, pres REAL, gas REAL, gas_med_1m REAL, baseline REAL,
+    deviation REAL, air_score REAL, state TEXT, heat_stable INTEGER,
+    heat_stable_ratio_1m REAL,
+    UNIQUE (node, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples (ts);
+
+CREATE TABLE IF NOT EXISTS batches (
+    ts INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    ts_end INTEGER, temp_avg REAL, hum_avg REAL, pres_avg REAL, gas_median REAL,
+    gas_min REAL, gas_max REAL, baseline_gas_end REAL, air_score_last REAL,
+    heat_stable_ratio REAL, minutes_good INTEGER, minutes_ok INTEGER,
+    minutes_bad INTEGER, air_state_last TEXT,
+    UNIQUE (node, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_batches_ts ON batches (ts);
+
+CREATE TABLE IF NOT EXISTS events (
+    ts INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    ts_end INTEGER, duration_s REAL, peak_deviation REAL, min_score REAL,
+    samples INTEGER, transitions INTEGER, state_before TEXT, state_after TEXT,
+    UNIQUE (node, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+
+CREATE TABLE IF NOT EXISTS minutes (
+    ts INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    ts_end INTEGER, n INTEGER, temp_avg REAL, hum_avg REAL, pres_avg REAL,
+    gas_median REAL, deviation_min REAL, air_score_avg REAL, air_score_min REAL,
+    state_last TEXT, samples_bad INTEGER,
+    UNIQUE (node, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_minutes_ts ON minutes (ts);
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+
+-- Índice de cobertura: tramos [start_ms, end_ms] de ts presentes en local por tabla y nodo
+CREATE TABLE IF NOT EXISTS coverage (
+    source TEXT NOT NULL,
+    node TEXT NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_coverage ON coverage (source, node, start_ms);
+
+-- Bytes lógicos descargados de cada archivo remoto (incluye lo recortado por la retención)
+CREATE TABLE IF NOT EXISTS sync_state (
+    remote TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+def connect(path=DB_PATH, read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path)
+        # WAL permite que el dashboard lea mientras el fetcher escribe
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def iso_to_ms(ts):
+    if ts is None:
+        return None
+    return int(datetime.fromisoformat(ts).timestamp() * 1000)
+
+def _row_from_record(table, obj):
+    spec = TABLES[table]
+    obj = air_schema.normalize_record(table, obj)
+    ts = iso_to_ms(obj.get(spec["ts_field"]))
+    if ts is None:
+        return None
+    values = []
+    for col in spec["columns"]:
+        v = obj.get(col)
+        if col == "ts_end":
+            v = iso_to_ms(v)
+        values.append(v)
+    return (ts, obj.get("node", DEFAULT_NODE), *values)
+
+def _insert_sql(table):
+    cols = ["ts", "node"] + TABLES[table]["columns"]
+    marks = ", ".join("?" for _ in cols)
+    return f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({marks})"
+
+def get_offset(conn, local_path):
+    row = conn.execute("SELECT offset FROM ingest_state WHERE path = ?", (local_path,)).fetchone()
+    return row["offset"] if row else 0
+
+def reset_offset(conn, local_path):
+    with conn:
+        conn.execute("DELETE FROM ingest_state WHERE path = ?", (local_path,))
+
+def get_sync_offset(conn, remote):
+    row = conn.execute("SELECT offset FROM sync_state WHERE remote = ?", (remote,)).fetchone()
+    return row["offset"] if row else None
+
+def set_sync_offset(conn, remote, offset):
+    with conn:
+        conn.execute(
+            "INSERT INTO sync_state (remote, offset) VALUES (?, ?) "
+            "ON CONFLICT(remote) DO UPDATE SET offset = excluded.offset",
+            (remote, offset),
+        )
+
+def _flush(conn, sql, rows, local_path, offset):
+    # Una transacción por lote: filas + offset avanzan juntos
+    with conn:
+        if rows:
+            conn.executemany(sql, rows)
+        conn.execute(
+            "INSERT INTO ingest_state (path, offset) VALUES (?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET offset = excluded.offset",
+            (local_path, offset),
+        )
+
+def ingest_file(conn, local_path, table):
+    """Ingiere las líneas completas añadidas a `local_path` desde la última pasada."""
+    if not os.path.exists(local_path):
+        return 0
+    if local_path.endswith(".bin"):
+        return _ingest_bin(conn, local_path)
+
+    offset = start_offset = get_offset(conn, local_path)
+    if os.path.getsize(local_path) < offset:
+        # El archivo local fue re-descargado: se re-ingiere (los duplicados se ignoran)
+        offset = 0
+
+    sql = _insert_sql(table)
+    rows = []
+    total = 0
+    spans = {}
+    with open(local_path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                # Línea a medio escribir: se reintenta en la siguiente pasada
+                break
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                row = _row_from_record(table, json.loads(line))
+            except (ValueError, TypeError) as e:
+                logging.warning(f"Línea inválida en {local_path}: {e}")
+                continue
+            if row is not None:
+                rows.append(row)
+                _extend_span(spans, row)
+            if len(rows) >= INGEST_BATCH_ROWS:
+                _flush(conn, sql, rows, local_path, offset)
+                total += len(rows)
+                rows = []
+    # Sin bytes nuevos no se escribe nada: así PRAGMA data_version sólo cambia con datos nuevos
+    if rows or offset != start_offset:
+        _flush(conn, sql, rows, local_path, offset)
+    for node, (lo, hi) in spans.items():
+        update_coverage(conn, table, node, lo, hi)
+    return total + len(rows)
+
+def _row_from_bin(values):
+    ts_ms, *rest = values
+    n = len(air_binlog.FLOAT_FIELDS)
+    floats = [None if v != v else v for v in rest[:n]]
+    state, heat_stable, ratio = rest[n:]
+    state = air_binlog.STATES[state] if state < len(air_binlog.STATES) else "UNKNOWN"
+    return (ts_ms, DEFAULT_NODE, *floats, state, heat_stable, None if ratio != ratio else ratio)
+
+def _ingest_bin(conn, local_path):
+    """Ingesta de air_samples.bin: sólo registros completos, leídos vía numpy.memmap."""
+    offset = get_offset(conn, local_path)
+    if os.path.getsize(local_path) < offset:
+        offset = 0
+
+    records = air_binlog.memmap_records(local_path)
+    first = max(0, (offset - air_binlog.HEADER.size) // air_binlog.RECORD.size)
+    sql = _insert_sql("samples")
+    total = 0
+    spans = {}
+    for start in range(first, len(records), INGEST_BATCH_ROWS):
+        chunk = records[start:start + INGEST_BATCH_ROWS].tolist()
+        offset = air_binlog.HEADER.size + (start + len(chunk)) * air_binlog.RECORD.size
+        rows = [_row_from_bin(values) for values in chunk]
+        _flush(conn, sql, rows, local_path, offset)
+        for row in rows:
+            _extend_span(spans, row)
+        total += len(rows)
+    del records  # libera el mapeo antes de que el fetcher vuelva a escribir el archivo
+    for node, (lo, hi) in spans.items():
+        update_coverage(conn, "samples", node, lo, hi)
+    return total
+
+# --- Índice de cobertura ---
+
+def _extend_span(spans, row):
+    ts, node = row[0], row[1]
+    lo, hi = spans.get(node, (ts, ts))
+    spans[node] = (min(lo, ts), max(hi, ts))
+
+def update_coverage(conn, table, node, lo, hi):
+    """Añade al índice las filas de [lo, hi] tras una ingesta, fundiéndolas con los tramos vecinos.
+
+    Las islas se calculan sólo sobre [lo, hi] (lo recién ingerido), nunca sobre el tramo
+    existente: en un nodo vivo éste es todo el histórico continuo.
+    """
+    gap = COVERAGE_GAP_MS.get(table)
+    if gap is None:
+        return
+    with conn:
+        islands = conn.execute(
+            f"SELECT MIN(ts), MAX(ts) FROM ("
+            f"  SELECT ts, SUM(brk) OVER (ORDER BY ts) AS grp FROM ("
+            f"    SELECT ts, CASE WHEN ts - LAG(ts) OVER (ORDER BY ts) > ? THEN 1 ELSE 0 END AS brk"
+            f"    FROM {table} WHERE node = ? AND ts BETWEEN ? AND ?"
+            f"  )"
+            f") GROUP BY grp ORDER BY 1",
+            (gap, node, lo, hi),
+        ).fetchall()
+        for start, end in islands:
+            # Todo tramo que toque [start - gap, end + gap] es contiguo a la isla: se funden.
+            # Caso habitual (muestras nuevas al final): un único tramo cuyo end_ms se alarga.
+            near = conn.execute(
+                "SELECT rowid, start_ms, end_ms FROM coverage "
+                "WHERE source = ? AND node = ? AND end_ms >= ? AND start_ms <= ?",
+                (table, node, start - gap, end + gap),
+            ).fetchall()
+            if len(near) == 1:
+                rowid, s0, e0 = near[0]
+                conn.execute(
+                    "UPDATE coverage SET start_ms = ?, end_ms = ? WHERE rowid = ?",
+                    (min(s0, start), max(e0, end), rowid),
+                )
+                continue
+            for rowid, s0, e0 in near:
+                start, end = min(start, s0), max(end, e0)
+            conn.executemany("DELETE FROM coverage WHERE rowid = ?", [(r[0],) for r in near])
+            conn.execute(
+                "INSERT INTO coverage (source, node, start_ms, end_ms) VALUES (?, ?, ?, ?)",
+                (table, node, start, end),
+            )
+
+def rebuild_coverage(conn):
+    """Construye el índice para almacenes previos a su existencia."""
+    for table in COVERAGE_GAP_MS:
+        for node, lo, hi in conn.execute(f"SELECT node, MIN(ts), MAX(ts) FROM {table} GROUP BY node").fetchall():
+            has = conn.execute("SELECT 1 FROM coverage WHERE source = ? AND node = ? LIMIT 1", (table, node)).fetchone()
+            if not has:
+                update_coverage(conn, table, node, lo, hi)
+
+def coverage(conn, table, node=DEFAULT_NODE):
+    return [tuple(r) for r in conn.execute(
+        "SELECT start_ms, end_ms FROM coverage WHERE source = ? AND node = ? ORDER BY start_ms",
+        (table, node),
+    )]
+
+def missing_ranges(conn, table, lo, hi, node=DEFAULT_NODE):
+    """Huecos (a, b) abiertos dentro de [lo, hi] sin datos locales: se busca a < ts < b."""
+    gap = COVERAGE_GAP_MS[table]
+    gaps = []
+    prev = None
+    for start, end in conn.execute(
+        "SELECT start_ms, end_ms FROM coverage WHERE source = ? AND node = ? AND end_ms >= ? AND start_ms <= ? "
+        "ORDER BY start_ms",
+        (table, node, lo, hi),
+    ):
+        if prev is None:
+            # lo/hi son instantes reales del remoto: cualquier diferencia en los bordes es un hueco
+            if start > lo:
+                gaps.append((lo - 1, start))
+        elif start - prev > gap:
+            gaps.append((prev, start))
+        prev = end if prev is None else max(prev, end)
+    if prev is None:
+        gaps.append((lo - 1, hi + 1))
+    elif hi > prev:
+        gaps.append((prev, hi + 1))
+    return gaps
+
+# --- Consultas para el dashboard ---
+
+def latest_sample(conn):
+    row = conn.execute("SELECT * FROM samples ORDER BY ts DESC LIMIT 1").fetchone()
+    return dict(row) if row else None
+
+def count_rows(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def summary(conn, table):
+    """Máx temperatura, mín humedad, calidad media y correlación Humedad/Calidad en SQL."""
+    m = TABLES[table]["metrics"]
+    t, h, q = m["Temperature"], m["Humidity"], m["Air Quality"]
+    row = conn.execute(f"SELECT MAX({t}), MIN({h}), AVG({q}) FROM {table}").fetchone()
+    c = conn.execute(
+        f"SELECT COUNT(*), AVG({h}), AVG({q}), AVG({h}*{q}), AVG({h}*{h}), AVG({q}*{q}) "
+        f"FROM {table} WHERE {h} IS NOT NULL AND {q} IS NOT NULL"
+    ).fetchone()
+
+    correlation = None
+    n, ex, ey, exy, exx, eyy = c
+    if n and n > 1:
+        var = (exx - ex * ex) * (eyy - ey * ey)
+        if var > 0:
+            correlation = (exy - ex * ey) / math.sqrt(var)
+    return {
+        "max_temp": row[0],
+        "min_hum": row[1],
+        "avg_aq": row[2],
+        "correlation": correlation,
+    }
+
+def _metric_select(table):
+    # Proyección: sólo el tiempo y las métricas que pinta el dashboard
+    m = TABLES[table]["metrics"]
+    cols = ", ".join(f'{col} AS "{name}"' for name, col in m.items())
+    return f"ts, {cols}"
+
+def downsampled(conn, table, step):
+    """Una de cada `step` filas (por rowid, sin ordenar la tabla entera), devueltas por tiempo."""
+    import pandas as pd
+    sql = f"SELECT {_metric_select(table)} FROM {table} WHERE rowid % ? = 0 ORDER BY ts"
+    return air_schema.typed_frame(pd.read_sql_query(sql, conn, params=(max(1, int(step)),)))
+
+def recent_events(conn, n=50):
+    import pandas as pd
+    sql = "SELECT * FROM events ORDER BY ts DESC LIMIT ?"
+    return air_schema.typed_frame(pd.read_sql_query(sql, conn, params=(n,)))
+
+def samples_range(conn, start_ms, end_ms):
+    """Muestras entre dos instantes (ms epoch), usando el índice de ts."""
+    import pandas as pd
+    sql = f"SELECT {_metric_select('samples')}, state FROM samples WHERE ts BETWEEN ? AND ? ORDER BY ts"
+    return air_schema.typed_frame(pd.read_sql_query(sql, conn, params=(int(start_ms), int(end_ms))))
+
+def tail(conn, table, n=100):
+    import pandas as pd
+    sql = f"SELECT * FROM (SELECT * FROM {table} ORDER BY ts DESC LIMIT ?) ORDER BY ts"
+    return air_schema.typed_frame(pd.read_sql_query(sql, conn, params=(n,)))
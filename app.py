@@ -1,225 +1,208 @@
-import streamlit as st
-import pandas as pd
-import json
-import os
 import time
+_T_START = time.perf_counter()
+import os
 import math
-import streamlit.components.v1 as components
+import sqlite3
+import streamlit as st
+import pandas as pd
+import air_store
 
 # Configuración de página
 st.set_page_config(page_title="Air Guardian", page_icon="⚙️", layout="wide")
 
-# Estilos globales para la app
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Courier+Prime:ital,wght@0,400;0,700;1,400;1,700&family=Playfair+Display:ital,wght@0,400..900;1,400..900&display=swap');
-
-    .stApp {
-        background-color: #1a1511;
-        background-image: radial-gradient(#2b221a 10%, transparent 20%),
-                          radial-gradient(#2b221a 10%, transparent 20%);
-        background-position: 0 0, 10px 10px;
-        background-size: 20px 20px;
-        color: #d4af37;
-        font-family: 'Courier Prime', monospace;
-    }
-    
-    /* Títulos y Header */
-    h1, h2, h3, .stMetric label {
-        font-family: 'Playfair Display', serif;
-        color: #d4af37 !important;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.8);
-    }
-    
-    /* Sidebar Steampunk */
-    [data-testid="stSidebar"] {
-        background-color: #2b221a;
-        border-right: 5px double #8b6508;
-    }
-    
-    [data-testid="stSidebar"] * {
-        color: #e6c27a !important;
-        font-family: 'Playfair Display', serif;
-    }
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
 
-    /* Tarjetas de métricas */
-    [data-testid="stMetric"] {
-        background-color: rgba(30, 20, 15, 0.8);
-        border: 2px solid #8b6508;
-        border-radius: 10px;
-        padding: 15px;
-        box-shadow: inset 0 0 10px rgba(0,0,0,0.8);
-    }
-    
-    .stMetric [data-testid="stMetricValue"] {
-        color: #e6c27a;
-    }
+# Modo perfilado (AIR_PROFILE=1 o ?profile=1 en la URL): tiempo por sección de cada ejecución
+PROFILE = os.environ.get("AIR_PROFILE") == "1" or st.query_params.get("profile") == "1"
 
-    /* Estilo de Gráficas (Sobreescribir colores de Streamlit si es posible) */
-    .stChart {
-        background-color: rgba(0,0,0,0.3);
-        border-radius: 10px;
-        border: 1px solid #8b6508;
-        padding: 10px;
-    }
-</style>
-""", unsafe_allow_html=True)
+class Profiler:
+    """Cronómetro por tramos: mark(sección) anota el tiempo transcurrido desde la marca anterior."""
+
+    def __init__(self, start=None):
+        self.t = time.perf_counter() if start is None else start
+        self.sections = []
+
+    def mark(self, section):
+        if PROFILE:
+            now = time.perf_counter()
+            self.sections.append((section, (now - self.t) * 1000))
+            self.t = now
+
+    def frame(self):
+        return pd.DataFrame(self.sections, columns=["Sección", "ms"]).round(1)
+
+# La primera marca incluye los imports: en frío (proceso nuevo) es el grueso del primer pintado
+profiler = Profiler(_T_START)
+profiler.mark("imports")
+
+@st.cache_resource
+def load_asset(name):
+    # Los estáticos se leen una vez por proceso; en cada rerun sólo se reutiliza la cadena
+    with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+# Funciones de lógica de color importadas de led_tiles_bme680.py
+def clamp(x, a, b): return max(a, min(b, x))
+def lerp(a, b, t): return a + (b - a) * t
+
+def base_rgb(state, score, t_val):
+    if state == "WARMUP" or state == "HEATING":
+        breathe = 0.45 + 0.55 * (0.5 + 0.5 * math.sin(t_val * 0.55))
+        r = 0
+        g = int(lerp(18,  70, breathe))
+        b = int(lerp(55, 230, breathe))
+        return f"rgb({r}, {g}, {b})"
+
+    if score is None:
+        return "rgb(0, 110, 0)"
+
+    s = float(clamp(score / 100.0, 0.0, 1.0))
+    q = 1.0 - s
+
+    if q <= 0.5:
+        t2 = q / 0.5
+        r = int(lerp(0,   235, t2))
+        g = int(lerp(150, 235, t2))
+        b = 0
+    else:
+        t2 = (q - 0.5) / 0.5
+        r = 235
+        g = int(lerp(235, 0, t2))
+        b = 0
+    return f"rgb({r}, {g}, {b})"
+
+def gear_html(state_class, led_color):
+    # Plantilla estática; sólo cambian la clase de estado y el color del LED
+    return load_asset("gear.html").replace("__STATE_CLASS__", state_class).replace("__LED_COLOR__", led_color)
+
+# Estilos globales para la app (assets/dashboard.css, sin fuentes remotas)
+st.markdown(f"<style>{load_asset('dashboard.css')}</style>", unsafe_allow_html=True)
+profiler.mark("estilos")
 
 # Navegación en el Sidebar
 st.sidebar.title("🛠️ Panel de Control")
 page = st.sidebar.radio("Seleccionar Vista:", ["Real-Time", "Historial Atmosférico"])
 
-# Auto-refresh cada 30 segundos en Real-Time
-auto_refresh = st.sidebar.checkbox("Sincronización Automática (30s)", value=True)
+# Auto-refresh parcial del panel Real-Time (no se bloquea ningún hilo del servidor)
+SAMPLE_PERIOD_SEC = 2  # SAMPLE_EVERY de air_logger.py: no tiene sentido refrescar más rápido
+auto_refresh = st.sidebar.checkbox("Sincronización Automática", value=True)
+refresh_sec = st.sidebar.slider("Intervalo de refresco (s)", min_value=SAMPLE_PERIOD_SEC, max_value=60, value=30, disabled=not auto_refresh)
+profiler.mark("sidebar")
 
 # Rutas locales
 BATCH_PATH = "air_batches_15m.jsonl"
 SAMPLES_PATH = "air_samples.jsonl"
+MINUTES_PATH = "air_samples_1m.jsonl"  # agregados de la retención de la Pi
+SAMPLES_BIN_PATH = "air_samples.bin"  # formato binario opcional (AIR_SAMPLES_FORMAT=bin en la Pi)
 
-def load_jsonl(path, last_only=False):
-    if not os.path.exists(path):
-        return None
-    
-    data_list = []
+@st.cache_resource
+def open_store():
+    # Una única conexión de sólo lectura por proceso al almacén que mantiene data_fetcher.py.
+    # Si falla no se cachea: el siguiente rerun vuelve a intentarlo.
+    return air_store.connect(air_store.DB_PATH, read_only=True)
+
+store = None
+if os.path.exists(air_store.DB_PATH):
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    data_list.append(json.loads(line))
-        
-        if last_only:
-            return data_list[-1] if data_list else None
-        return pd.DataFrame(data_list)
-    except Exception as e:
-        return None
+        store = open_store()
+    except sqlite3.Error:
+        store = None
+profiler.mark("almacén")
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def history_overview(table, data_version, max_points):
+    """Conteo, resumen y serie diezmada de `table`. `data_version` (PRAGMA de la conexión
+    compartida) sólo cambia cuando el fetcher confirma una ingesta: sin datos nuevos, cambiar
+    cualquier widget de la página no vuelve a recorrer la tabla."""
+    total_rows = air_store.count_rows(store, table)
+    if not total_rows:
+        return 0, None, None
+    return total_rows, air_store.summary(store, table), air_store.downsampled(store, table, max(1, total_rows // max_points))
+
+@st.cache_resource
+def get_feed():
+    # Un único vigilante del archivo de muestras por proceso, compartido por todas las pestañas
+    import live_feed  # numpy + hilo vigilante: sólo si se abre la vista Real-Time
+    path = SAMPLES_BIN_PATH if os.path.exists(SAMPLES_BIN_PATH) else SAMPLES_PATH
+    return live_feed.SampleFeed(path).start()
+
+LED_SCORE_STEP = 5  # escalones de calidad con los que cambia el color del LED
+
+LIVE_SERIES_LABELS = {"gas": "Gas (Ω)", "air_score": "Calidad", "temp": "Temp (°C)", "hum": "Humedad (%)"}
 
 # --- VISTA REAL-TIME ---
 if page == "Real-Time":
     st.title("⚙️ Air Guardian Dashboard 🚂")
+    import streamlit.components.v1 as components
     
-    # La vista en tiempo real ahora usa los Samples (resolución sub-segundo/2-segundos)
-    latest_data = load_jsonl(SAMPLES_PATH, last_only=True)
-    
-    # Funciones de lógica de color importadas de led_tiles_bme680.py
-    def clamp(x, a, b): return max(a, min(b, x))
-    def lerp(a, b, t): return a + (b - a) * t
-
-    def base_rgb(state, score, t_val):
-        if state == "WARMUP" or state == "HEATING":
-            breathe = 0.45 + 0.55 * (0.5 + 0.5 * math.sin(t_val * 0.55))
-            r = 0
-            g = int(lerp(18,  70, breathe))
-            b = int(lerp(55, 230, breathe))
-            return f"rgb({r}, {g}, {b})"
-
-        if score is None:
-            return "rgb(0, 110, 0)"
-
-        s = float(clamp(score / 100.0, 0.0, 1.0))
-        q = 1.0 - s
-
-        if q <= 0.5:
-            t2 = q / 0.5
-            r = int(lerp(0,   235, t2))
-            g = int(lerp(150, 235, t2))
-            b = 0
-        else:
-            t2 = (q - 0.5) / 0.5
-            r = 235
-            g = int(lerp(235, 0, t2))
-            b = 0
-        return f"rgb({r}, {g}, {b})"
+    # Sólo este fragmento se re-ejecuta con el temporizador: CSS, sidebar y resto de la
+    # página no se vuelven a enviar; cada tick lee únicamente la última muestra.
+    live_window_min = st.select_slider("Ventana en vivo (min):", options=[5, 10, 15, 30, 60], value=10)
 
-    state_class = "ok"
-    temp, hum, score, heat_ratio, air_state = 0.0, 0.0, 0.0, 1.0, "UNKNOWN"
-    led_color = "rgb(46, 184, 46)" # Default verde
-
-    if latest_data is not None:
-        # En air_samples.jsonl las llaves son 'temp', 'hum', 'air_score'
-        temp = latest_data.get("temp", latest_data.get("temperature", 0.0))
-        hum = latest_data.get("hum", latest_data.get("humidity", 0.0))
-        score = latest_data.get("air_score", 0.0)
-        heat_ratio = latest_data.get("heat_stable_ratio_1m", latest_data.get("heat_stable_ratio", 1.0))
-        air_state = latest_data.get("state", latest_data.get("air_state_last", "OK")).upper()
-
-        if air_state == "BAD" or (score is not None and score < 40):
-            state_class = "bad"
-        elif air_state == "WARMUP" or heat_ratio < 0.6:
-            state_class = "heating"
-            air_state = "WARMUP"
-            
-        t_val = time.time()
-        led_color = base_rgb(air_state, score, t_val)
-    else:
-        st.warning("🏮 Esperando suministro de datos... Asegúrate de que data_fetcher.py esté corriendo.")
-
-    col1, col2, col3, col4 = st.columns(4)
-    # Mostramos los valores limpios al decimo
-    col1.metric("Temperatura Local", f"{temp:.1f} °C" if temp is not None else "-- °C")
-    col2.metric("Humedad Local", f"{hum:.1f} %" if hum is not None else "-- %")
-    col3.metric("Calidad Aire (Actual)", f"{score:.1f}" if score is not None else "--")
-    col4.metric("Estado Físico", str(air_state))
-
-    # Componente HTML de Animación Mejorada con Engranajes Reales (Vectoriales) e inyección RGB real
-    steampunk_html = f"""
-    <div style="display:flex; justify-content:center; align-items:center; height:400px; background: transparent;">
-        <style>
-            @keyframes spin {{ from {{ transform: rotate(0deg); }} to {{ transform: rotate(360deg); }} }}
-            @keyframes spin-rev {{ from {{ transform: rotate(0deg); }} to {{ transform: rotate(-360deg); }} }}
-            @keyframes pulse {{ 0%, 100% {{ opacity: 0.5; transform: scale(1); }} 50% {{ opacity: 1; transform: scale(1.1); }} }}
-            
-            .container {{ position: relative; width: 300px; height: 300px; border: 12px solid #8b6508; border-radius: 50%; background: #2b221a; box-shadow: inset 0 0 50px #000, 0 0 20px rgba(0,0,0,0.5); overflow: hidden; }}
-            
-            /* Engranaje Victoriano con dientes */
-            .gear {{
-                position: absolute;
-                fill: #d4af37;
-                opacity: 0.8;
-                filter: drop-shadow(2px 2px 2px #000);
-            }}
-            .g1 {{ width: 120px; height: 120px; top: 10px; left: 10px; animation: spin 15s linear infinite; }}
-            .g2 {{ width: 80px; height: 80px; bottom: 20px; right: 20px; animation: spin-rev 10s linear infinite; }}
-            .g3 {{ width: 60px; height: 60px; top: 100px; right: 10px; animation: spin 8s linear infinite; opacity: 0.5; }}
+    @st.fragment(run_every=refresh_sec if auto_refresh else None)
+    def live_panel():
+        # La vista en tiempo real usa los Samples (resolución de 2 segundos).
+        # El feed compartido ya ha volcado la cola nueva en su búfer circular.
+        tick = Profiler()
+        feed = get_feed()
+        latest_data = feed.latest()
+        if latest_data is None and store is not None:
+            latest_data = air_store.latest_sample(store)
+
+        state_class = "ok"
+        temp, hum, score, heat_ratio, air_state = 0.0, 0.0, 0.0, 1.0, "UNKNOWN"
+        led_color = "rgb(46, 184, 46)" # Default verde
+
+        if latest_data is not None:
+            # En air_samples.jsonl las llaves son 'temp', 'hum', 'air_score'
+            temp = latest_data.get("temp", latest_data.get("temperature", 0.0))
+            hum = latest_data.get("hum", latest_data.get("humidity", 0.0))
+            score = latest_data.get("air_score", 0.0)
+            heat_ratio = latest_data.get("heat_stable_ratio_1m", latest_data.get("heat_stable_ratio", 1.0))
+            air_state = latest_data.get("state", latest_data.get("air_state_last", "OK")).upper()
+
+            if air_state == "BAD" or (score is not None and score < 40):
+                state_class = "bad"
+            elif air_state == "WARMUP" or heat_ratio < 0.6:
+                state_class = "heating"
+                air_state = "WARMUP"
             
-            .core {{
-                position: absolute;
-                top: 50%; left: 50%;
-                transform: translate(-50%, -50%);
-                width: 60px; height: 60px;
-                border-radius: 50%;
-                background: #444;
-                border: 4px solid #8b6508;
-                z-index: 10;
-            }}
-
-            /* Estados Dinámicos y Velocidades (Los colores reales se inyectan en style) */
-            .state-ok .core {{ background: radial-gradient(circle, {led_color} 0%, rgba(0,0,0,0.8) 100%); box-shadow: 0 0 20px {led_color}; }}
-            .state-ok .gear {{ fill: #8b6508; }}
-
-            .state-heating .core {{ background: radial-gradient(circle, {led_color} 0%, rgba(0,0,0,0.8) 100%); animation: pulse 2s infinite ease-in-out; }}
-            .state-heating .gear {{ fill: {led_color}; animation-duration: 5s; }}
-
-            .state-bad .core {{ background: radial-gradient(circle, {led_color} 0%, rgba(0,0,0,0.8) 100%); animation: pulse 0.5s infinite; }}
-            .state-bad .gear {{ fill: {led_color}; animation-duration: 2s; }}
-        </style>
-        
-        <div class="container state-{state_class}">
-            <!-- SVG de Engranaje Steampunk -->
-            <svg class="gear g1" viewBox="0 0 100 100">
-                <path d="M50 0 L55 10 L65 10 L70 0 L80 5 L75 15 L85 25 L95 20 L100 30 L90 35 L90 45 L100 50 L95 60 L85 55 L75 65 L80 75 L70 80 L65 70 L55 70 L50 80 L40 75 L45 65 L35 55 L25 60 L20 50 L30 45 L30 35 L20 30 L25 20 L35 25 L45 15 L40 5 Z M50 30 A20 20 0 1 0 50 70 A20 20 0 1 0 50 30 Z" />
-            </svg>
-            <svg class="gear g2" viewBox="0 0 100 100">
-                <path d="M50 0 L55 10 L65 10 L70 0 L80 5 L75 15 L85 25 L95 20 L100 30 L90 35 L90 45 L100 50 L95 60 L85 55 L75 65 L80 75 L70 80 L65 70 L55 70 L50 80 L40 75 L45 65 L35 55 L25 60 L20 50 L30 45 L30 35 L20 30 L25 20 L35 25 L45 15 L40 5 Z M50 30 A20 20 0 1 0 50 70 A20 20 0 1 0 50 30 Z" />
-            </svg>
-            <svg class="gear g3" viewBox="0 0 100 100">
-                <path d="M50 0 L55 10 L65 10 L70 0 L80 5 L75 15 L85 25 L95 20 L100 30 L90 35 L90 45 L100 50 L95 60 L85 55 L75 65 L80 75 L70 80 L65 70 L55 70 L50 80 L40 75 L45 65 L35 55 L25 60 L20 50 L30 45 L30 35 L20 30 L25 20 L35 25 L45 15 L40 5 Z M50 30 A20 20 0 1 0 50 70 A20 20 0 1 0 50 30 Z" />
-            </svg>
-            <div class="core"></div>
-        </div>
-    </div>
-    """
-    components.html(steampunk_html, height=420)
+            # Color cuantizado y sin `time.time()`: el HTML del iframe sólo cambia al pasar de
+            # escalón o de estado, así el navegador no lo recarga (ni reinicia los engranajes)
+            # en cada tick. La respiración del WARMUP la hace la animación CSS `pulse`.
+            score_q = None if score is None else round(score / LED_SCORE_STEP) * LED_SCORE_STEP
+            led_color = base_rgb(air_state, score_q, 0.0)
+        else:
+            st.warning("🏮 Esperando suministro de datos... Asegúrate de que data_fetcher.py esté corriendo.")
+        tick.mark("feed")
+
+        col1, col2, col3, col4 = st.columns(4)
+        # Mostramos los valores limpios al decimo
+        col1.metric("Temperatura Local", f"{temp:.1f} °C" if temp is not None else "-- °C")
+        col2.metric("Humedad Local", f"{hum:.1f} %" if hum is not None else "-- %")
+        col3.metric("Calidad Aire (Actual)", f"{score:.1f}" if score is not None else "--")
+        col4.metric("Estado Físico", str(air_state))
+
+        # Componente HTML de Animación Mejorada con Engranajes Reales (Vectoriales) e inyección RGB real
+        components.html(gear_html(state_class, led_color), height=420)
+        tick.mark("métricas y engranajes")
+
+        ts, values = feed.ring.window(live_window_min * 60)
+        if len(ts):
+            st.write(f"**📈 Pulso en Vivo: últimos {live_window_min} minutos**")
+            index = pd.to_datetime(ts, unit="s", utc=True)
+            spark_cols = st.columns(len(feed.ring.fields))
+            for j, field in enumerate(feed.ring.fields):
+                spark_cols[j].caption(LIVE_SERIES_LABELS[field])
+                spark_cols[j].line_chart(pd.DataFrame({field: values[:, j]}, index=index), height=140)
+        tick.mark("pulso en vivo")
+
+        if PROFILE:
+            # Desde el fragmento no se puede escribir en el sidebar: el tick se resume aquí
+            st.caption("⏱️ Tick del panel: " + " · ".join(f"{name} {ms:.1f} ms" for name, ms in tick.sections))
+
+    live_panel()
+    profiler.mark("panel en vivo")
     
     if st.button("🔄 Forzar Sincronización"):
         st.rerun()
@@ -231,40 +214,39 @@ elif page == "Historial Atmosférico":
     st.markdown("*Análisis profundo de los registros almacenados*")
     
     # Selector de archivo
-    source = st.selectbox("Seleccionar Registro:", ["Muestras Granulares (Samples)", "Promedios por Batch (15m)"])
-    file_path = SAMPLES_PATH if "Samples" in source else BATCH_PATH
+    SOURCES = {
+        "Muestras Granulares (Samples)": ("samples", SAMPLES_PATH),
+        "Promedios por Minuto (1m, compactados)": ("minutes", MINUTES_PATH),
+        "Promedios por Batch (15m)": ("batches", BATCH_PATH),
+    }
+    source = st.selectbox("Seleccionar Registro:", list(SOURCES))
+    table, file_path = SOURCES[source]
     
-    df = load_jsonl(file_path)
+    # El diezmado se hace en la base de datos: sólo viajan MAX_POINTS filas al proceso
+    MAX_POINTS = 1000
+    total_rows, stats, df_plot = 0, None, None
+    if store is not None:
+        data_version = store.execute("PRAGMA data_version").fetchone()[0]
+        total_rows, stats, df_plot = history_overview(table, data_version, MAX_POINTS)
+    profiler.mark("resumen y diezmado SQL")
     
-    if df is not None and not df.empty:
-        # Intentar normalizar nombres de columnas
-        df = df.rename(columns={
-            "temperature_last": "Temperature", "temperature": "Temperature", "Temp": "Temperature", "temp_avg": "Temperature", "temp": "Temperature",
-            "humidity_last": "Humidity", "humidity": "Humidity", "Humidity": "Humidity", "hum_avg": "Humidity", "hum": "Humidity",
-            "air_score_last": "Air Quality", "air_score": "Air Quality", "score": "Air Quality"
-        })
-        # Mostrar Resumen estadístico estilo antiguo
+    if total_rows:
+        # Mostrar Resumen estadístico estilo antiguo (agregados calculados en SQL)
         st.subheader("📊 Resumen de la Expedición")
         stats_col1, stats_col2, stats_col3 = st.columns(3)
         
         # Safe extraction
-        max_temp = df['Temperature'].max() if 'Temperature' in df.columns else 0.0
-        min_hum = df['Humidity'].min() if 'Humidity' in df.columns else 0.0
-        avg_aq = df['Air Quality'].mean() if 'Air Quality' in df.columns else 0.0
+        max_temp = stats["max_temp"] if stats["max_temp"] is not None else 0.0
+        min_hum = stats["min_hum"] if stats["min_hum"] is not None else 0.0
+        avg_aq = stats["avg_aq"] if stats["avg_aq"] is not None else 0.0
 
         stats_col1.metric("Máx Temp", f"{max_temp:.1f} °C")
         stats_col2.metric("Mín Hum", f"{min_hum:.1f} %")
         stats_col3.metric("Calidad Promedio", f"{avg_aq:.1f}")
 
         # --- OPTIMIZACIÓN DE RENDIMIENTO (DOWNSAMPLING) ---
-        MAX_POINTS = 1000
-        total_rows = len(df)
         if total_rows > MAX_POINTS:
-            step = total_rows // MAX_POINTS
-            df_plot = df.iloc[::step]
             st.caption(f"⚡ *Modo Optimizador Activo: Mostrando {len(df_plot)} muestras representativas de un total de {total_rows} para evitar sobrecarga del navegador.*")
-        else:
-            df_plot = df
 
         # Gráficas
         st.subheader("📈 Gráficas de Evolución")
@@ -279,11 +261,11 @@ elif page == "Historial Atmosférico":
         st.subheader("🧪 Análisis de Correlación (IA)");
         st.write("**Estudio de Impacto Ambiental: Humedad vs Calidad**")
         
-        if 'Humidity' in df.columns and 'Air Quality' in df.columns:
-            # Análisis de correlación simple (Usando el DataFrame completo, NO el diezmado, para precisión IA)
-            correlation = df['Humidity'].corr(df['Air Quality'])
+        if 'Humidity' in df_plot.columns and 'Air Quality' in df_plot.columns:
+            # Análisis de correlación simple (Sobre el histórico completo en SQL, NO el diezmado, para precisión IA)
+            correlation = stats["correlation"]
             # Handle NaN from corr
-            if pd.isna(correlation): correlation = 0.0
+            if correlation is None: correlation = 0.0
             
             col_ia1, col_ia2 = st.columns([2, 1])
             
@@ -307,16 +289,69 @@ elif page == "Historial Atmosférico":
                 </div>
                 """, unsafe_allow_html=True)
         
+        profiler.mark("gráficas")
+
+        # Cobertura: los huecos se muestran tal cual, sin interpolar
+        try:
+            spans = air_store.coverage(store, table)
+        except sqlite3.Error:
+            spans = []
+        holes = [(a, b) for (_, a), (b, _) in zip(spans, spans[1:])]
+        if holes:
+            lost_min = sum(b - a for a, b in holes) / 60000
+            st.caption(f"🕳️ *Huecos sin datos en este registro: {len(holes)} ({lost_min:.0f} min en total). El fetcher los recupera de la Pi si aún existen allí.*")
+            with st.expander("🗺️ Ver Mapa de Cobertura"):
+                holes_df = pd.DataFrame(holes, columns=["Desde", "Hasta"])
+                for col in holes_df.columns:
+                    holes_df[col] = pd.to_datetime(holes_df[col], unit="ms", utc=True)
+                holes_df["Minutos"] = ((holes_df["Hasta"] - holes_df["Desde"]).dt.total_seconds() / 60).round(1)
+                st.dataframe(holes_df, use_container_width=True)
+
         # Visualizar tabla de datos
         with st.expander("📜 Ver Registros en Bruto"):
 
-            st.dataframe(df.tail(100), use_container_width=True)
+            st.dataframe(air_store.tail(store, table, 100), use_container_width=True)
+        profiler.mark("cobertura y registros")
             
     else:
         st.info(f"📜 El archivo de bitácora `{file_path}` aún no ha sido sincronizado o está vacío.")
-        st.image("https://www.publicdomainpictures.net/pictures/30000/velka/old-paper-texture-1.jpg", width=400)
+        st.image(os.path.join(ASSETS_DIR, "old_paper.svg"), width=400)
+
+
+    # --- Incidentes BAD (episodios precalculados en la Pi, sin escanear las muestras) ---
+    try:
+        events = air_store.recent_events(store) if store is not None else None
+    except sqlite3.Error:
+        events = None
+
+    if events is not None and not events.empty:
+        st.subheader("🚨 Bitácora de Incidentes (Aire Viciado)")
+        events["Inicio"] = events.index
+        events = events.rename(columns={"ts_end": "Fin"})
+        st.dataframe(
+            events[["Inicio", "Fin", "duration_s", "peak_deviation", "min_score", "transitions", "state_before", "state_after"]],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        labels = [f"{row.Inicio:%Y-%m-%d %H:%M} · {row.duration_s / 60:.1f} min · pico {0 if pd.isna(row.peak_deviation) else row.peak_deviation:+.0%}" for row in events.itertuples()]
+        chosen = st.selectbox("Inspeccionar incidente:", range(len(labels)), format_func=lambda i: labels[i])
+        incident = events.iloc[chosen]
+
+        # Margen de 5 minutos alrededor del episodio; consulta por rango sobre el índice de ts
+        margin = pd.Timedelta(minutes=5)
+        df_incident = air_store.samples_range(
+            store,
+            (incident["Inicio"] - margin).timestamp() * 1000,
+            (incident["Fin"] + margin).timestamp() * 1000,
+        )
+        if not df_incident.empty:
+            st.line_chart(df_incident[["Air Quality"]])
+        profiler.mark("incidentes")
 
-# Manejo del auto-refresh (Al final para no bloquear la carga visual)
-if page == "Real-Time" and auto_refresh:
-    time.sleep(30)
-    st.rerun()
+if PROFILE:
+    profiler.mark("resto")
+    with st.sidebar.expander("⏱️ Perfil de renderizado", expanded=True):
+        timings = profiler.frame()
+        st.dataframe(timings, hide_index=True, use_container_width=True)
+        st.caption(f"Total: {timings['ms'].sum():.1f} ms")
@@ -2,7 +2,13 @@ import time
 import paramiko
 import os
 import socket
+import json
+import shlex
 import logging
+import io
+import sqlite3
+import air_store
+from raspberry_pi_scripts import air_binlog, air_range_read
 
 # Configuración del logging para monitorear el script
 logging.basicConfig(
@@ -15,15 +21,142 @@ HOST = "192.168.0.149"
 USER = "pi"
 PASSWORD = "pi"
 FILES_TO_SYNC = [
-    {"remote": "/home/pi/air/data/air_batches_15m.jsonl", "local": "air_batches_15m.jsonl"},
-    {"remote": "/home/pi/air/data/air_samples.jsonl", "local": "air_samples.jsonl"}
+    {"remote": "/home/pi/air/data/air_batches_15m.jsonl", "local": "air_batches_15m.jsonl", "table": "batches"},
+    {"remote": "/home/pi/air/data/air_samples.jsonl", "local": "air_samples.jsonl", "table": "samples"},
+    {"remote": "/home/pi/air/data/air_events.jsonl", "local": "air_events.jsonl", "table": "events"},
+    # Formato binario opcional (AIR_SAMPLES_FORMAT=bin en la Pi); se sincroniza byte a byte igual
+    {"remote": "/home/pi/air/data/air_samples.bin", "local": "air_samples.bin", "table": "samples"},
+    # Agregados de 1 minuto generados por la retención de la Pi (air_retention.py)
+    {"remote": "/home/pi/air/data/air_samples_1m.jsonl", "local": "air_samples_1m.jsonl", "table": "minutes"}
 ]
+# Handshake de retención: la Pi publica cuántos bytes ha recortado de la cabeza de cada archivo
+# y el fetcher confirma cuántos bytes lógicos tiene ya en local; la Pi nunca recorta más allá.
+REMOTE_RETENTION_STATE = "/home/pi/air/data/air_retention_state.json"
+REMOTE_SYNC_ACK = "/home/pi/air/data/air_sync_ack.json"
+# Lector por rangos de ts en la Pi (raspberry_pi_scripts/air_range_read.py)
+REMOTE_RANGE_READ = "/home/pi/air/air_range_read.py"
+MAX_RANGES_PER_CALL = 100
 CHECK_INTERVAL_SEC = 30
 CHUNK_SIZE = 8192
 
+class RetentionInProgress(Exception):
+    """El archivo remoto cambió de recorte mientras se leía; el ciclo siguiente lo reintenta."""
+
+def read_remote_json(sftp, path):
+    try:
+        with sftp.open(path, 'r') as f:
+            return json.loads(f.read())
+    except (IOError, ValueError):
+        return {}
+
+def write_remote_json(sftp, path, obj):
+    # Escritura atómica: la Pi nunca ve un ack a medias
+    tmp = path + ".tmp"
+    with sftp.open(tmp, 'w') as f:
+        f.write(json.dumps(obj))
+    sftp.posix_rename(tmp, path)
+
+def remote_exec(ssh, args):
+    _, stdout, stderr = ssh.exec_command(" ".join(shlex.quote(str(a)) for a in args))
+    data = stdout.read()
+    if stdout.channel.recv_exit_status() != 0:
+        raise IOError(stderr.read().decode("utf-8", "replace").strip())
+    return data
+
+def close_partial_tail(local_path):
+    """Recorta el registro a medias del final del espejo local. Devuelve los bytes quitados
+    (None si el .bin aún no tiene cabecera). El llamador los descuenta del offset sincronizado
+    para que la siguiente descarga incremental traiga el registro entero."""
+    size = os.path.getsize(local_path)
+    if local_path.endswith(".bin"):
+        header, record = air_binlog.HEADER.size, air_binlog.RECORD.size
+        if size < header:
+            return None
+        extra = (size - header) % record
+    else:
+        extra = 0
+        with open(local_path, 'rb') as f:
+            while extra < size:
+                f.seek(max(0, size - extra - CHUNK_SIZE))
+                block = f.read(size - extra - f.tell())
+                nl = block.rfind(b"\n")
+                if nl >= 0:
+                    extra += len(block) - nl - 1
+                    break
+                extra += len(block)
+    if extra:
+        with open(local_path, 'r+b') as f:
+            f.truncate(size - extra)
+    return extra
+
+def backfill(ssh, sftp, store, file_info, synced, rotation=False):
+    """Pide a la Pi sólo los tramos de ts que faltan en local y los añade al espejo.
+
+    Fuera de una rotación sólo se buscan huecos anteriores al último ts del espejo local: lo
+    posterior lo trae la descarga incremental por offset. Si se recorta un registro a medias,
+    el offset sincronizado se actualiza en el almacén (el llamador debe releerlo).
+    """
+    remote_path, local_path, table = file_info["remote"], file_info["local"], file_info["table"]
+    if table not in air_store.COVERAGE_GAP_MS or not os.path.exists(local_path):
+        return 0
+
+    field = air_store.TABLES[table]["ts_field"]
+    _, local_last = air_range_read.bounds(local_path, field)
+    if local_last is None and not rotation:
+        return 0
+
+    reader = ["python3", REMOTE_RANGE_READ, remote_path, "--field", field]
+    copy_path = None
+    try:
+        bounds = json.loads(remote_exec(ssh, reader + ["--bounds"]))
+        read_ranges = lambda ranges: remote_exec(ssh, reader + [v for r in ranges for v in r])
+    except IOError as e:
+        if not rotation:
+            logging.info(f"Lector por rangos no disponible en la Pi ({e}); no se revisan huecos de {remote_path}.")
+            return 0
+        # Rotación sin air_range_read.py en la Pi: se descarga una copia y se filtra aquí
+        logging.warning(f"Lector por rangos no disponible en la Pi ({e}); filtrando una copia completa.")
+        copy_path = local_path + ".remote"
+        sftp.get(remote_path, copy_path)
+        first, last = air_range_read.bounds(copy_path, field)
+        bounds = {"first": first, "last": last}
+
+        def read_ranges(ranges):
+            out = io.BytesIO()
+            air_range_read.read_ranges(copy_path, ranges, out, field)
+            return out.getvalue()
+
+    written = 0
+    try:
+        if bounds["first"] is None:
+            return 0
+        hi = bounds["last"] if rotation else min(bounds["last"], local_last)
+        gaps = air_store.missing_ranges(store, table, bounds["first"], hi) if hi >= bounds["first"] else []
+        if not gaps:
+            return 0
+        removed = close_partial_tail(local_path)
+        if removed is None:
+            return 0
+        if removed:
+            air_store.set_sync_offset(store, remote_path, synced - removed)
+        for i in range(0, len(gaps), MAX_RANGES_PER_CALL):
+            data = read_ranges(gaps[i:i + MAX_RANGES_PER_CALL])
+            if data:
+                with open(local_path, 'ab') as local_file:
+                    local_file.write(data)
+                written += len(data)
+    finally:
+        if copy_path and os.path.exists(copy_path):
+            os.remove(copy_path)
+    if written:
+        logging.info(f"Recuperados {written} bytes de {len(gaps)} huecos de cobertura en {local_path}.")
+    return written
+
 def sync_data():
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    store = air_store.connect()
+    air_store.rebuild_coverage(store)
     
     while True:
         sftp = None
@@ -33,34 +166,119 @@ def sync_data():
             sftp = ssh.open_sftp()
             logging.info("Conexión SSH y SFTP establecida correctamente.")
             
+            # Tras cada (re)conexión se revisan los huecos de cobertura una vez
+            check_gaps = True
             while True:
+                retention_state = read_remote_json(sftp, REMOTE_RETENTION_STATE)
+                acks = {}
                 for file_info in FILES_TO_SYNC:
                     remote_path = file_info["remote"]
                     local_path = file_info["local"]
                     
-                    # Obtener el tamaño del archivo local si ya existe
-                    local_size = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                    # Bytes lógicos ya descargados de este archivo remoto. Sin registro previo,
+                    # el espejo local coincide byte a byte con lo descargado.
+                    synced = air_store.get_sync_offset(store, remote_path)
+                    if synced is None:
+                        synced = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                    
+                    # Bytes ya recortados por la retención de la Pi: tamaño lógico = recortado + físico.
+                    # La entrada se vuelve a leer tras tocar el archivo: si cambió (o hay un recorte
+                    # "pending") el tamaño/offset leídos no casan con `trimmed` y se reintenta luego.
+                    name = os.path.basename(remote_path)
+                    retention_entry = retention_state.get(name, {})
+                    trimmed = retention_entry.get("trimmed_bytes", 0)
                     
                     try:
+                        if "pending" in retention_entry:
+                            raise RetentionInProgress(remote_path)
                         remote_stat = sftp.stat(remote_path)
-                        remote_size = remote_stat.st_size
+                        remote_size = trimmed + remote_stat.st_size
                         
-                        if remote_size > local_size:
+                        if remote_size > synced:
                             logging.info(f"Nuevos datos en {local_path}. Sincronizando...")
-                            with sftp.open(remote_path, 'rb') as remote_file:
-                                remote_file.seek(local_size)
-                                with open(local_path, 'ab') as local_file:
-                                    while True:
-                                        chunk = remote_file.read(CHUNK_SIZE)
-                                        if not chunk:
-                                            break
-                                        local_file.write(chunk)
+                            start = synced - trimmed
+                            if start < 0:
+                                # Cliente nuevo: la cabeza ya está compactada en air_samples_1m.jsonl
+                                logging.warning(f"{remote_path} fue recortado antes de sincronizarse; se descarga desde lo disponible.")
+                                start = 0
+                            written = 0
+                            local_before = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                            try:
+                                with sftp.open(remote_path, 'rb') as remote_file:
+                                    remote_file.seek(start)
+                                    with open(local_path, 'ab') as local_file:
+                                        while True:
+                                            chunk = remote_file.read(CHUNK_SIZE)
+                                            if not chunk:
+                                                break
+                                            local_file.write(chunk)
+                                            written += len(chunk)
+                                retention_state = read_remote_json(sftp, REMOTE_RETENTION_STATE)
+                                if retention_state.get(name, {}) != retention_entry:
+                                    # La Pi recortó el archivo durante la descarga
+                                    raise RetentionInProgress(remote_path)
+                            except BaseException:
+                                # Descarga incompleta (corte de red, recorte en la Pi, Ctrl+C): el espejo
+                                # vuelve exactamente a lo que cuenta `synced` y el ciclo siguiente la repite
+                                if os.path.exists(local_path):
+                                    with open(local_path, 'r+b') as local_file:
+                                        local_file.truncate(local_before)
+                                raise
+                            synced = trimmed + start + written
+                            air_store.set_sync_offset(store, remote_path, synced)
                             logging.info(f"Sincronización de {local_path} completada.")
-                        elif remote_size < local_size:
-                            logging.warning(f"Rotación detectada en {remote_path}. Re-descargando...")
-                            sftp.get(remote_path, local_path)
+                        elif remote_size < synced:
+                            retention_state = read_remote_json(sftp, REMOTE_RETENTION_STATE)
+                            if retention_state.get(name, {}) != retention_entry:
+                                # Recorte entre la lectura del estado y el stat, no una rotación
+                                raise RetentionInProgress(remote_path)
+                            if os.path.exists(local_path) and file_info["table"] in air_store.COVERAGE_GAP_MS:
+                                # Se conserva el histórico local y sólo se piden los tramos que falten
+                                logging.warning(f"Rotación detectada en {remote_path}. Recuperando huecos...")
+                                backfill(ssh, sftp, store, file_info, synced, rotation=True)
+                            else:
+                                # Sin índice de cobertura (p.ej. eventos) no se sabe qué falta: copia completa
+                                logging.warning(f"Rotación detectada en {remote_path}. Re-descargando...")
+                                sftp.get(remote_path, local_path)
+                                air_store.reset_offset(store, local_path)
+                            synced = remote_size
+                            air_store.set_sync_offset(store, remote_path, synced)
+                    except FileNotFoundError:
+                        # El nodo no genera este archivo (p.ej. formato de muestras no activado)
+                        pass
+                    except RetentionInProgress:
+                        logging.info(f"La Pi está recortando {remote_path}; se sincroniza en el próximo ciclo.")
                     except IOError as e:
                         logging.error(f"Error con {remote_path}: {e}")
+
+                    # Ingesta incremental de las líneas nuevas en el almacén embebido
+                    try:
+                        n = air_store.ingest_file(store, local_path, file_info["table"])
+                        if n:
+                            logging.info(f"{n} registros de {local_path} ingeridos en {air_store.DB_PATH}.")
+                    except (sqlite3.Error, ValueError) as e:
+                        logging.error(f"Error de ingesta en {air_store.DB_PATH}: {e}")
+                    
+                    if check_gaps:
+                        try:
+                            if backfill(ssh, sftp, store, file_info, synced):
+                                air_store.ingest_file(store, local_path, file_info["table"])
+                        except FileNotFoundError:
+                            pass
+                        except (IOError, ValueError, sqlite3.Error) as e:
+                            logging.warning(f"No se pudieron revisar huecos de {remote_path}: {e}")
+                        # backfill() descuenta del offset el registro a medias que haya recortado
+                        stored = air_store.get_sync_offset(store, remote_path)
+                        if stored is not None:
+                            synced = stored
+                    
+                    acks[name] = synced
+                
+                check_gaps = False
+                try:
+                    write_remote_json(sftp, REMOTE_SYNC_ACK, acks)
+                except IOError as e:
+                    logging.error(f"No se pudo confirmar la sincronización en {REMOTE_SYNC_ACK}: {e}")
                 
                 time.sleep(CHECK_INTERVAL_SEC)
 
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import air_store
+from raspberry_pi_scripts import air_binlog
+
+# inotify es opcional (sólo Linux); sin él se vigila el archivo por sondeo
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Publicador compartido: un único hilo vigila air_samples.jsonl, parsea cada línea
+# nueva una sola vez y la reparte a todos los suscriptores (sesiones del dashboard
+# o clientes SSE). Cada suscriptor sólo paga por los registros que aún no ha visto.
+SAMPLES_PATH = "air_samples.jsonl"
+BACKLOG_RECORDS = 1800     # 1 hora de muestras a 2 s
+TAIL_CHUNK = 64 * 1024     # al arrancar la cola se busca hacia atrás en bloques de este tamaño
+POLL_SEC = 0.5
+SSE_PORT = 8765
+# Sin autenticación: por defecto sólo local. AIR_SSE_HOST=0.0.0.0 lo abre a la red a propósito.
+SSE_HOST = os.environ.get("AIR_SSE_HOST", "127.0.0.1")
+SSE_KEEPALIVE_SEC = 15
+RING_FIELDS = ("gas", "air_score", "temp", "hum")
+RING_CAPACITY = 1800       # 60 minutos a 2 s
+
+class RingBuffer:
+    """Búfer circular preasignado de series numéricas; memoria constante."""
+
+    def __init__(self, capacity=RING_CAPACITY, fields=RING_FIELDS):
+        self.fields = fields
+        self._ts = np.full(capacity, np.nan)  # epoch en segundos
+        self._values = np.full((capacity, len(fields)), np.nan, dtype=np.float32)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def extend(self, records):
+        cap = len(self._ts)
+        with self._lock:
+            for rec in records:
+                try:
+                    ts = air_store.iso_to_ms(rec.get("ts")) / 1000.0
+                except (TypeError, ValueError):
+                    continue
+                self._ts[self._head] = ts
+                for j, field in enumerate(self.fields):
+                    v = rec.get(field)
+                    self._values[self._head, j] = np.nan if v is None else v
+                self._head = (self._head + 1) % cap
+                self._count = min(self._count + 1, cap)
+
+    def window(self, seconds):
+        """Copia cronológica (ts, valores) de los últimos `seconds` segundos."""
+        cap = len(self._ts)
+        with self._lock:
+            if not self._count:
+                return self._ts[:0].copy(), self._values[:0].copy()
+            idx = (np.arange(self._head - self._count, self._head)) % cap
+            ts = self._ts[idx]
+            values = self._values[idx]
+        keep = ts >= ts[-1] - seconds
+        return ts[keep], values[keep]
+
+class SampleFeed:
+    def __init__(self, path=SAMPLES_PATH, backlog=BACKLOG_RECORDS):
+        self.path = path
+        self._records = deque(maxlen=backlog)  # (seq, record)
+        self.ring = RingBuffer()
+        # Registros que se cargan al arrancar (o tras una rotación): los que caben en el búfer
+        # circular, igual en JSONL que en .bin, para que las ventanas largas salgan completas
+        self._tail_records = max(backlog, RING_CAPACITY)
+        self._seq = 0
+        self._offset = None
+        self._last_ts = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="sample-feed", daemon=True)
+
+    def start(self):
+        self._safe_read()
+        self._thread.start()
+        return self
+
+    # --- Lado suscriptor ---
+
+    def since(self, seq):
+        """Devuelve (último seq, registros posteriores a `seq`)."""
+        with self._cond:
+            if seq >= self._seq:
+                return self._seq, []
+            # Se recorre desde el final: coste O(registros nuevos), no O(backlog)
+            new = []
+            for s, rec in reversed(self._records):
+                if s <= seq:
+                    break
+                new.append(rec)
+            new.reverse()
+            return self._seq, new
+
+    def latest(self):
+        with self._cond:
+            return self._records[-1][1] if self._records else None
+
+    def wait(self, seq, timeout=None):
+        """Bloquea hasta que haya registros posteriores a `seq` (o expire `timeout`)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout=timeout)
+        return self.since(seq)
+
+    # --- Lado publicador ---
+
+    def _read_new(self):
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if self._offset is not None and size < self._offset:
+            # Rotación/re-descarga: se vuelve a empezar por la cola del archivo
+            self._offset = None
+        if size == self._offset:
+            return
+
+        if self.path.endswith(".bin"):
+            parsed = self._read_bin(size)
+        else:
+            parsed = self._read_lines(size)
+        parsed = self._drop_stale(parsed)
+
+        if parsed:
+            self.ring.extend(parsed)
+            with self._cond:
+                for rec in parsed:
+                    self._seq += 1
+                    self._records.append((self._seq, rec))
+                self._cond.notify_all()
+
+    def _drop_stale(self, parsed):
+        # Los huecos recuperados por el backfill del fetcher se añaden al final del archivo
+        # aunque sean antiguos; el feed en vivo sólo publica lo posterior a lo ya publicado.
+        fresh = []
+        for rec in parsed:
+            try:
+                ts = air_store.iso_to_ms(rec.get("ts"))
+            except (TypeError, ValueError):
+                continue
+            if self._last_ts is None or ts > self._last_ts:
+                self._last_ts = ts
+                fresh.append(rec)
+        return fresh
+
+    def _read_lines(self, size):
+        parsed = []
+        with open(self.path, 'rb') as f:
+            if self._offset is None:
+                # Primer arranque: sólo las últimas líneas completas del archivo
+                self._offset = self._tail_offset(f, size, self._tail_records)
+            f.seek(self._offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                self._offset += len(raw)
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    parsed.append(json.loads(line))
+                except ValueError as e:
+                    logging.warning(f"Línea inválida en {self.path}: {e}")
+        return parsed
+
+    @staticmethod
+    def _tail_offset(f, size, lines):
+        """Inicio de la primera de las últimas `lines` líneas completas (leyendo hacia atrás)."""
+        # El último salto de línea cierra la última línea completa; cada salto anterior marca
+        # el final de la línea previa. Lo que haya tras el último salto es una línea a medias.
+        seen_last = False
+        found = 0
+        pos = size
+        while pos > 0:
+            start = max(0, pos - TAIL_CHUNK)
+            f.seek(start)
+            block = f.read(pos - start)
+            i = len(block)
+            while True:
+                i = block.rfind(b"\n", 0, i)
+                if i < 0:
+                    break
+                if not seen_last:
+                    seen_last = True
+                    continue
+                found += 1
+                if found == lines:
+                    return start + i + 1
+            pos = start
+        return 0
+
+    def _read_bin(self, size):
+        header, record = air_binlog.HEADER.size, air_binlog.RECORD.size
+        if size < header:
+            return []
+        with open(self.path, 'rb') as f:
+            if self._offset is None:
+                air_binlog.check_header(f.read(header))
+                # Primer arranque: sólo los últimos registros (alineados al tamaño fijo)
+                count = (size - header) // record
+                self._offset = header + max(0, count - self._tail_records) * record
+            f.seek(self._offset)
+            data = f.read((size - self._offset) // record * record)
+        self._offset += len(data)
+        return list(air_binlog.unpack_records(data))
+
+    def _run(self):
+        if INotify is not None:
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    def _run_inotify(self):
+        inotify = INotify()
+        watch_dir = os.path.dirname(os.path.abspath(self.path))
+        name = os.path.basename(self.path)
+        inotify.add_watch(watch_dir, flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.CLOSE_WRITE)
+        while True:
+            events = inotify.read(timeout=int(POLL_SEC * 1000 * 10))
+            if not events or any(e.name == name for e in events):
+                self._safe_read()
+
+    def _run_polling(self):
+        last = None
+        while True:
+            try:
+                st = os.stat(self.path)
+                sig = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                sig = None
+            if sig != last:
+                last = sig
+                self._safe_read()
+            time.sleep(POLL_SEC)
+
+    def _safe_read(self):
+        try:
+            self._read_new()
+        except (OSError, ValueError) as e:
+            logging.error(f"Error leyendo {self.path}: {e}")
+
+# --- Sidecar SSE opcional para otras herramientas ---
+
+def make_sse_handler(feed):
+    class SSEHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/events":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            seq = 0
+            latest = feed.latest()
+            try:
+                if latest is not None:
+                    seq, _ = feed.since(0)
+                    self._send(seq, latest)
+                while True:
+                    seq_new, records = feed.wait(seq, timeout=SSE_KEEPALIVE_SEC)
+                    if not records:
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+                        continue
+                    for i, rec in enumerate(records, start=seq_new - len(records) + 1):
+                        self._send(i, rec)
+                    seq = seq_new
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _send(self, seq, rec):
+            payload = json.dumps(rec, separators=(",", ":"), ensure_ascii=False)
+            self.wfile.write(f"id: {seq}\ndata: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def log_message(self, fmt, *args):
+            logging.info(fmt % args)
+
+    return SSEHandler
+
+def serve_sse(path=SAMPLES_PATH, port=SSE_PORT, host=SSE_HOST):
+    feed = SampleFeed(path).start()
+    server = ThreadingHTTPServer((host, port), make_sse_handler(feed))
+    server.daemon_threads = True
+    logging.info(f"Feed SSE de {path} en http://{host}:{port}/events")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - [%(levelname)s] - %(message)s'
+    )
+    serve_sse()
@@ -0,0 +1,84 @@
+import os
+import math
+import struct
+from datetime import datetime, timezone
+
+# Formato binario compacto de muestras (alternativa a air_samples.jsonl).
+# Cabecera versionada + registros de ancho fijo: ~46 bytes por muestra frente a ~300 en JSONL,
+# y el lado PC puede mapearlo directamente con numpy.memmap.
+MAGIC = b"AIRB"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")  # magic, versión, tamaño de registro
+
+FLOAT_FIELDS = ("temp", "hum", "pres", "gas", "gas_med_1m", "baseline", "deviation", "air_score")
+STATES = ("UNKNOWN", "WARMUP", "GOOD", "OK", "BAD")
+
+# ts epoch-ms, 8 float32, estado (enum), heat_stable, heat_stable_ratio_1m
+RECORD = struct.Struct("<q8fBBf")
+
+# Mismo layout para numpy (sin padding, little-endian)
+DTYPE_SPEC = (
+    [("ts_ms", "<i8")]
+    + [(name, "<f4") for name in FLOAT_FIELDS]
+    + [("state", "u1"), ("heat_stable", "u1"), ("heat_stable_ratio_1m", "<f4")]
+)
+
+def _f(v):
+    return math.nan if v is None else float(v)
+
+def _none_if_nan(v):
+    return None if v != v else float(v)
+
+def pack_sample(sample):
+    ts_ms = int(datetime.fromisoformat(sample["ts"]).timestamp() * 1000)
+    state = sample.get("state")
+    return RECORD.pack(
+        ts_ms,
+        *(_f(sample.get(name)) for name in FLOAT_FIELDS),
+        STATES.index(state) if state in STATES else 0,
+        1 if sample.get("heat_stable") else 0,
+        _f(sample.get("heat_stable_ratio_1m")),
+    )
+
+def append_bin(path, sample):
+    record = pack_sample(sample)
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        f.write(record)
+
+def check_header(data):
+    magic, version, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"Cabecera binaria no soportada: {magic!r} v{version} ({record_size} bytes)")
+
+def record_to_dict(values):
+    """Convierte una tupla (ts_ms, floats..., estado, heat_stable, ratio) al dict de air_samples.jsonl."""
+    ts_ms = values[0]
+    n = len(FLOAT_FIELDS)
+    sample = {"ts": datetime.fromtimestamp(ts_ms / 1000, timezone.utc).isoformat()}
+    for name, v in zip(FLOAT_FIELDS, values[1:1 + n]):
+        sample[name] = _none_if_nan(v)
+    state = values[1 + n]
+    sample["state"] = STATES[state] if state < len(STATES) else "UNKNOWN"
+    sample["heat_stable"] = bool(values[2 + n])
+    sample["heat_stable_ratio_1m"] = _none_if_nan(values[3 + n])
+    return sample
+
+def unpack_records(data):
+    """Itera dicts a partir de bytes que contienen registros completos (sin cabecera)."""
+    for values in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+        yield record_to_dict(values)
+
+def memmap_records(path):
+    """Vista numpy.memmap (sólo lectura) de todos los registros completos del archivo."""
+    import numpy as np
+    size = os.path.getsize(path)
+    if size < HEADER.size:
+        return np.zeros(0, dtype=np.dtype(DTYPE_SPEC))
+    with open(path, "rb") as f:
+        check_header(f.read(HEADER.size))
+    count = (size - HEADER.size) // RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=np.dtype(DTYPE_SPEC))
+    return np.memmap(path, dtype=np.dtype(DTYPE_SPEC), mode="r", offset=HEADER.size, shape=(count,))
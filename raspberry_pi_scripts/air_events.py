@@ -0,0 +1,64 @@
+import time
+
+# Detector en línea de episodios de aire viciado (BAD).
+# Memoria constante: sólo guarda el episodio abierto y el estado anterior.
+CLOSE_AFTER_SEC = 30   # histéresis: el episodio se cierra tras 30 s seguidos fuera de BAD
+
+class EpisodeDetector:
+    def __init__(self, node="air-sensor", close_after=CLOSE_AFTER_SEC):
+        self.node = node
+        self.close_after = close_after
+        self.prev_state = None
+        self.episode = None
+
+    def update(self, ts, state, deviation=None, score=None, t=None):
+        """Procesa una muestra. Devuelve el episodio cerrado (dict) o None."""
+        t = time.time() if t is None else t
+        closed = None
+        ep = self.episode
+
+        if ep is not None and state != self.prev_state:
+            ep["transitions"] += 1
+
+        if state == "BAD":
+            if ep is None:
+                ep = self.episode = {
+                    "node": self.node,
+                    "ts_start": ts,
+                    "t_start": t,
+                    "state_before": self.prev_state,
+                    "peak_deviation": None,
+                    "min_score": None,
+                    "samples": 0,
+                    "transitions": 0,
+                }
+            ep["ts_end"] = ts
+            ep["t_end"] = t
+            ep["samples"] += 1
+            ep["transitions_in"] = ep["transitions"]
+            if deviation is not None and (ep["peak_deviation"] is None or abs(deviation) > abs(ep["peak_deviation"])):
+                ep["peak_deviation"] = deviation
+            if score is not None and (ep["min_score"] is None or score < ep["min_score"]):
+                ep["min_score"] = score
+        elif ep is not None and t - ep["t_end"] >= self.close_after:
+            closed = self._close(state)
+
+        self.prev_state = state
+        return closed
+
+    def _close(self, state_after):
+        ep = self.episode
+        self.episode = None
+        return {
+            "node": ep["node"],
+            "ts_start": ep["ts_start"],
+            "ts_end": ep["ts_end"],
+            "duration_s": round(ep["t_end"] - ep["t_start"], 1),
+            "peak_deviation": ep["peak_deviation"],
+            "min_score": ep["min_score"],
+            "samples": ep["samples"],
+            # cambios de estado entre ts_start y ts_end: mide el "parpadeo" del episodio
+            "transitions": ep["transitions_in"],
+            "state_before": ep["state_before"],
+            "state_after": state_after,
+        }
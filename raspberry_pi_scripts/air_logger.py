@@ -1,17 +1,27 @@
-import os, time, math, json, statistics
+import os, time, math, json, statistics, threading
 from collections import deque
 from datetime import datetime, timezone
 import bme680
+from air_events import EpisodeDetector
+import air_binlog
+import air_retention
 
 DATA_DIR = "/home/pi/air/data"
-SAMPLES_PATH = os.path.join(DATA_DIR, "air_samples.jsonl")
+# AIR_SAMPLES_FORMAT=bin escribe las muestras en el formato binario compacto de air_binlog.py
+SAMPLES_FORMAT = os.environ.get("AIR_SAMPLES_FORMAT", "jsonl")
+SAMPLES_PATH = os.path.join(DATA_DIR, "air_samples.bin" if SAMPLES_FORMAT == "bin" else "air_samples.jsonl")
 BATCHES_PATH = os.path.join(DATA_DIR, "air_batches_15m.jsonl")
+EVENTS_PATH = os.path.join(DATA_DIR, "air_events.jsonl")
 
 SAMPLE_EVERY = 2.0
 WARMUP_MIN = 10
 WINDOW_1M = int(60 / SAMPLE_EVERY)
 WINDOW_15M = int((15*60) / SAMPLE_EVERY)
 
+RETENTION_EVERY_SEC = 3600
+# Lo comparten los appends de muestras y la retención (que corre en su propio hilo)
+SAMPLES_LOCK = threading.Lock()
+
 BASELINE_ALPHA = 0.01
 MAX_BASELINE_DRIFT = 0.35
 
@@ -59,11 +69,20 @@ def append_jsonl(path, obj):
     with open(path, "a", encoding="utf-8") as f:
         f.write(json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n")
 
+def run_retention():
+    try:
+        trimmed = air_retention.compact(SAMPLES_PATH, DATA_DIR, lock=SAMPLES_LOCK)
+        if trimmed:
+            print(f"retention: {trimmed} bytes compactados en {air_retention.AGG_NAME}")
+    except Exception as e:
+        print("retention error:", e)
+
 def mean_or_none(x):
     return float(statistics.mean(x)) if x else None
 
 def main():
     os.makedirs(DATA_DIR, exist_ok=True)
+    air_retention.recover(SAMPLES_PATH, DATA_DIR)
     sensor = make_sensor()
     setup_sensor(sensor)
 
@@ -79,14 +98,18 @@ def main():
     pres_15 = deque(maxlen=WINDOW_15M)
     stable_15 = deque(maxlen=WINDOW_15M)
     state_15 = []
+    detector = EpisodeDetector()
 
     print("air_logger running. Writing:")
     print("  samples:", SAMPLES_PATH)
     print("  batches:", BATCHES_PATH)
+    print("  events: ", EVENTS_PATH)
 
     align_to_next_15m_epoch()
     batch_start_iso = now_iso()
     batch_start_t = time.time()
+    retention_t = time.time()
+    retention_thread = None
 
     while True:
         warmup = (time.time() - start_ts) < (WARMUP_MIN * 60)
@@ -142,7 +165,15 @@ def main():
             "heat_stable": heat_stable,
             "heat_stable_ratio_1m": hs_ratio_1m,
         }
-        append_jsonl(SAMPLES_PATH, sample)
+        with SAMPLES_LOCK:
+            if SAMPLES_FORMAT == "bin":
+                air_binlog.append_bin(SAMPLES_PATH, sample)
+            else:
+                append_jsonl(SAMPLES_PATH, sample)
+
+        episode = detector.update(sample["ts"], state, deviation=drel, score=score)
+        if episode is not None:
+            append_jsonl(EVENTS_PATH, episode)
 
         if gas is not None: gas_15.append(gas)
         if temp is not None: temp_15.append(temp)
@@ -185,6 +216,12 @@ def main():
             batch_start_iso = ts_end
             batch_start_t = time.time()
 
+        # Retención escalonada en segundo plano: la copia del crudo no frena el muestreo
+        if time.time() - retention_t >= RETENTION_EVERY_SEC and not (retention_thread and retention_thread.is_alive()):
+            retention_t = time.time()
+            retention_thread = threading.Thread(target=run_retention, name="retention", daemon=True)
+            retention_thread.start()
+
         time.sleep(SAMPLE_EVERY)
 
 if __name__ == "__main__":
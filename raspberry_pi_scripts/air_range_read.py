@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+from datetime import datetime
+
+try:
+    import air_binlog
+except ImportError:  # importado desde el PC (data_fetcher.py) como paquete
+    from raspberry_pi_scripts import air_binlog
+
+# Lectura por rangos de tiempo para el fetcher (vía ssh exec), así sólo viajan los huecos.
+#
+#   air_range_read.py ARCHIVO [--field CAMPO] --bounds        -> {"first": ms, "last": ms} en JSON
+#   air_range_read.py ARCHIVO [--field CAMPO] A B [A B ...]   -> registros crudos con A < ts < B (ms epoch)
+#
+# CAMPO es el timestamp de cada línea JSONL ("ts" en muestras, "ts_start" en batches y
+# agregados de 1 minuto); los .bin siempre llevan el ts en la cabecera del registro.
+#
+# Los archivos de la Pi están ordenados por ts, así que cada rango se localiza por búsqueda
+# binaria (por bytes en JSONL, por índice de registro en .bin) sin leer el archivo entero.
+
+def _ts_of(line, field):
+    try:
+        return int(datetime.fromisoformat(json.loads(line)[field]).timestamp() * 1000)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def _line_at(f, size, pos, field):
+    """(inicio, ts) de la primera línea completa y válida que empieza en `pos` o después."""
+    if pos > 0:
+        f.seek(pos - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    while True:
+        start = f.tell()
+        if start >= size:
+            return size, None
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            return size, None
+        ts = _ts_of(line, field)
+        if ts is not None:
+            return start, ts
+
+def _jsonl_first_after(f, size, target, field):
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start, ts = _line_at(f, size, mid, field)
+        if ts is None or ts > target:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _line_at(f, size, lo, field)[0]
+
+def _jsonl_bounds(f, size, field):
+    _, first = _line_at(f, size, 0, field)
+    last = None
+    pos = size
+    while last is None and pos > 0:
+        pos = max(0, pos - 4096)
+        f.seek(pos)
+        for line in f.read(size - pos).split(b"\n")[1 if pos else 0:]:
+            ts = _ts_of(line, field) if line.strip() else None
+            if ts is not None:
+                last = ts
+    return first, last
+
+def _jsonl_ranges(path, ranges, out, field):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for a, b in ranges:
+            f.seek(_jsonl_first_after(f, size, a, field))
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                ts = _ts_of(line, field)
+                if ts is None:
+                    continue
+                if ts >= b:
+                    break
+                out.write(line)
+
+def _bin_ts(f, i):
+    f.seek(air_binlog.HEADER.size + i * air_binlog.RECORD.size)
+    return air_binlog.RECORD.unpack(f.read(air_binlog.RECORD.size))[0]
+
+def _bin_count(f, size):
+    if size < air_binlog.HEADER.size:
+        return 0
+    f.seek(0)
+    air_binlog.check_header(f.read(air_binlog.HEADER.size))
+    return (size - air_binlog.HEADER.size) // air_binlog.RECORD.size
+
+def _bin_ranges(path, ranges, out):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        count = _bin_count(f, size)
+        for a, b in ranges:
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if _bin_ts(f, mid) > a:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            i = lo
+            while i < count:
+                f.seek(air_binlog.HEADER.size + i * air_binlog.RECORD.size)
+                record = f.read(air_binlog.RECORD.size)
+                if air_binlog.RECORD.unpack(record)[0] >= b:
+                    break
+                out.write(record)
+                i += 1
+
+def bounds(path, field="ts"):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if path.endswith(".bin"):
+            count = _bin_count(f, size)
+            if not count:
+                return None, None
+            return _bin_ts(f, 0), _bin_ts(f, count - 1)
+        return _jsonl_bounds(f, size, field)
+
+def read_ranges(path, ranges, out, field="ts"):
+    if path.endswith(".bin"):
+        _bin_ranges(path, ranges, out)
+    else:
+        _jsonl_ranges(path, ranges, out, field)
+
+def main(argv):
+    if len(argv) < 2:
+        sys.exit("uso: air_range_read.py ARCHIVO [--field CAMPO] --bounds | A B [A B ...]")
+    path, args = argv[1], argv[2:]
+    field = "ts"
+    if args[:1] == ["--field"]:
+        field, args = args[1], args[2:]
+    if args == ["--bounds"]:
+        first, last = bounds(path, field) if os.path.exists(path) else (None, None)
+        print(json.dumps({"first": first, "last": last}))
+        return
+    values = [int(v) for v in args]
+    if len(values) % 2:
+        sys.exit("los rangos van por pares A B")
+    if not os.path.exists(path):
+        return
+    ranges = list(zip(values[::2], values[1::2]))
+    read_ranges(path, ranges, sys.stdout.buffer, field)
+    sys.stdout.buffer.flush()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import statistics
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+import air_binlog
+
+# Retención escalonada en la Pi: las muestras crudas (2 s) se conservan RAW_RETENTION_DAYS;
+# lo anterior se compacta en agregados de 1 minuto (air_samples_1m.jsonl) y se recorta del
+# principio del archivo crudo. Nunca se recorta nada que el fetcher no haya confirmado.
+#
+# Handshake con data_fetcher.py:
+#   air_sync_ack.json         (lo escribe el fetcher)  {"air_samples.jsonl": bytes lógicos ya sincronizados}
+#   air_retention_state.json  (lo escribe este módulo) {"air_samples.jsonl": {"trimmed_bytes": N}}
+# Offset lógico = trimmed_bytes + offset físico en el archivo actual.
+#
+# Mientras se sustituye el archivo crudo la entrada lleva además "pending": X (bytes que se
+# están recortando). El fetcher lee el estado antes y después de consultar el archivo y sólo
+# confía en la lectura si ambas coinciden y no hay "pending": así nunca empareja un
+# trimmed_bytes antiguo con un archivo ya recortado.
+RAW_RETENTION_DAYS = float(os.environ.get("AIR_RAW_RETENTION_DAYS", "7"))
+# El recorte reescribe el crudo entero: se espera a que sobren al menos estas horas para que
+# ocurra ~1 vez al día y no en cada pasada horaria (escrituras en la SD).
+TRIM_BATCH_HOURS = float(os.environ.get("AIR_TRIM_BATCH_HOURS", "24"))
+ACK_NAME = "air_sync_ack.json"
+STATE_NAME = "air_retention_state.json"
+AGG_NAME = "air_samples_1m.jsonl"
+NODE = "air-sensor"
+COPY_CHUNK = 1024 * 1024
+
+def _load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json_atomic(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+def _iter_jsonl(f):
+    """(offset final, ts_ms, muestra) por cada línea completa."""
+    offset = 0
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            return
+        offset += len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            sample = json.loads(line)
+            ts_ms = int(datetime.fromisoformat(sample["ts"]).timestamp() * 1000)
+        except (ValueError, KeyError, TypeError):
+            continue
+        yield offset, ts_ms, sample
+
+def _iter_bin(f):
+    header = f.read(air_binlog.HEADER.size)
+    if len(header) < air_binlog.HEADER.size:
+        return
+    air_binlog.check_header(header)
+    offset = air_binlog.HEADER.size
+    while True:
+        data = f.read(air_binlog.RECORD.size * 1024)
+        if not data:
+            return
+        for values in air_binlog.RECORD.iter_unpack(data[:len(data) - len(data) % air_binlog.RECORD.size]):
+            offset += air_binlog.RECORD.size
+            yield offset, values[0], air_binlog.record_to_dict(values)
+        if len(data) % air_binlog.RECORD.size:
+            return
+
+def _mean(xs):
+    return float(statistics.mean(xs)) if xs else None
+
+def _aggregate_minute(minute_ms, samples):
+    def col(name):
+        return [s[name] for s in samples if s.get(name) is not None]
+    scores = col("air_score")
+    states = [s.get("state") for s in samples]
+    return {
+        "node": NODE,
+        "ts_start": _iso(minute_ms),
+        "ts_end": _iso(minute_ms + 60_000),
+        "n": len(samples),
+        "temp_avg": _mean(col("temp")),
+        "hum_avg": _mean(col("hum")),
+        "pres_avg": _mean(col("pres")),
+        "gas_median": float(statistics.median(col("gas"))) if col("gas") else None,
+        "deviation_min": min(col("deviation")) if col("deviation") else None,
+        "air_score_avg": _mean(scores),
+        "air_score_min": min(scores) if scores else None,
+        "state_last": states[-1] if states else None,
+        "samples_bad": states.count("BAD"),
+    }
+
+def _recover_pending(path, state_path, state, name):
+    """Cierra un recorte interrumpido: si el .tmp sigue ahí no llegó a sustituirse el archivo."""
+    entry = state.get(name, {})
+    if "pending" not in entry:
+        return
+    trimmed = entry.get("trimmed_bytes", 0)
+    if os.path.exists(path + ".tmp"):
+        os.remove(path + ".tmp")
+    else:
+        trimmed += entry["pending"]
+    state[name] = {"trimmed_bytes": trimmed}
+    _write_json_atomic(state_path, state)
+
+def _copy(src, dst):
+    while True:
+        chunk = src.read(COPY_CHUNK)
+        if not chunk:
+            return
+        dst.write(chunk)
+
+def recover(path, data_dir):
+    """Al arrancar: cierra un recorte que un corte de luz dejó en "pending" para que el fetcher
+    no tenga que esperar a la primera pasada de compact()."""
+    state_path = os.path.join(data_dir, STATE_NAME)
+    _recover_pending(path, state_path, _load_json(state_path), os.path.basename(path))
+
+def compact(path, data_dir, now=None, lock=None):
+    """Compacta y recorta la cabeza de `path`. Devuelve los bytes recortados.
+
+    `lock` es el que toma el logger para cada append: sólo se retiene para copiar la cola
+    escrita durante la copia principal y sustituir el archivo, así el muestreo no se bloquea.
+    """
+    if not os.path.exists(path):
+        return 0
+    name = os.path.basename(path)
+    is_bin = path.endswith(".bin")
+    start = air_binlog.HEADER.size if is_bin else 0
+
+    state_path = os.path.join(data_dir, STATE_NAME)
+    state = _load_json(state_path)
+    _recover_pending(path, state_path, state, name)
+    trimmed = state.get(name, {}).get("trimmed_bytes", 0)
+    acked = _load_json(os.path.join(data_dir, ACK_NAME)).get(name)
+    if acked is None:
+        return 0
+    acked_physical = acked - trimmed
+
+    now = time.time() if now is None else now
+    cutoff_ms = int((now - RAW_RETENTION_DAYS * 86400) // 60 * 60 * 1000)
+    batch_ms = int(TRIM_BATCH_HOURS * 3600 * 1000)
+
+    # 1) Recorrer la cabeza del archivo agrupando por minuto, hasta la edad o el ack
+    aggregates = []
+    cut = start
+    minute, minute_samples = None, []
+    prev_end = start
+    with open(path, "rb") as f:
+        for end, ts_ms, sample in (_iter_bin(f) if is_bin else _iter_jsonl(f)):
+            m = ts_ms // 60_000 * 60_000
+            if m != minute:
+                # Minuto anterior completo: ya puede compactarse
+                if minute_samples:
+                    aggregates.append(_aggregate_minute(minute, minute_samples))
+                    cut = prev_end
+                minute, minute_samples = m, []
+            if prev_end == start and ts_ms >= cutoff_ms - batch_ms:
+                break  # aún no sobra un lote completo
+            if ts_ms >= cutoff_ms or end > acked_physical:
+                break
+            minute_samples.append(sample)
+            prev_end = end
+    if cut <= start:
+        return 0
+
+    # 2) Agregados primero (duplicados tras un corte de luz se ignoran en la ingesta por ts)
+    agg_path = os.path.join(data_dir, AGG_NAME)
+    with open(agg_path, "a", encoding="utf-8") as f:
+        for agg in aggregates:
+            f.write(json.dumps(agg, separators=(",", ":"), ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    # 3) Reescribir el crudo sin la cabeza recortada y avanzar trimmed_bytes
+    tmp = path + ".tmp"
+    with open(path, "rb") as src, open(tmp, "wb") as dst:
+        if is_bin:
+            dst.write(src.read(start))
+        src.seek(cut)
+        _copy(src, dst)
+        with lock or nullcontext():
+            # Lo añadido por el logger durante la copia; a partir de aquí no escribe nadie
+            _copy(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+            # pending -> sustitución -> trimmed_bytes definitivo (ver cabecera)
+            state[name] = {"trimmed_bytes": trimmed, "pending": cut - start}
+            _write_json_atomic(state_path, state)
+            os.replace(tmp, path)
+            state[name] = {"trimmed_bytes": trimmed + (cut - start)}
+            _write_json_atomic(state_path, state)
+    return cut - start